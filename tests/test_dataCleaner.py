@@ -0,0 +1,303 @@
+import unittest
+import sys, os
+import io, contextlib
+sys.path.append(os.path.abspath(os.path.join('..')))
+
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from scipy.spatial.distance import cdist
+
+from scripts import dataCleaner as cleaner_module
+from scripts.dataCleaner import dataCleaner
+
+
+class TestFillNa(unittest.TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame({'a': [1.0, np.nan, 3.0, 3.0, 8.0],
+                                's': ['x', None, 'y', 'y', 'z'],
+                                'i': [1, 2, 3, 4, 5]})
+
+    def test_fill_mean(self):
+        """
+        Test that it fills the nulls with the mean of the column
+        """
+        df = dataCleaner(self.df).fill_na('mean', ['a', 'i']).df
+        self.assertEqual(df['a'][1], 3.75)
+        self.assertFalse(df['a'].isna().any())
+
+    def test_fill_median(self):
+        """
+        Test that it fills the nulls with the median of the column
+        """
+        df = dataCleaner(self.df).fill_na('median', ['a']).df
+        self.assertEqual(df['a'][1], 3.0)
+        self.assertFalse(df['a'].isna().any())
+
+    def test_fill_mode(self):
+        """
+        Test that it fills the nulls with the mode of the column, object
+        columns included
+        """
+        df = dataCleaner(self.df).fill_na('mode', ['a', 's']).df
+        self.assertEqual(df['a'][1], 3.0)
+        self.assertEqual(df['s'][1], 'y')
+        self.assertFalse(df[['a', 's']].isna().any().any())
+
+    def test_fill_mode_dtypes(self):
+        """
+        Test that mode fills keep datetime, nullable integer and category
+        columns
+        """
+        start = pd.Timestamp('2019-04-04 12:01')
+        df = pd.DataFrame({
+            'd': [start, pd.NaT, start, pd.Timestamp('2019-04-25 14:35')],
+            'n': pd.array([2, None, 2, 5], dtype='Int64'),
+            'c': pd.Categorical(['x', None, 'x', 'y'])})
+        dtypes = df.dtypes.tolist()
+        df = dataCleaner(df).fill_na('mode', ['d', 'n', 'c']).df
+        self.assertEqual(df.dtypes.tolist(), dtypes)
+        self.assertEqual(df['d'][1], start)
+        self.assertEqual(df['n'][1], 2)
+        self.assertEqual(df['c'][1], 'x')
+
+    def test_fill_median_nullable_integer(self):
+        """
+        Test that median fills keep nullable integer columns
+        """
+        df = pd.DataFrame({'n': pd.array([1, None, 3, 5], dtype='Int64')})
+        df = dataCleaner(df).fill_na('median', ['n']).df
+        self.assertEqual(str(df['n'].dtype), 'Int64')
+        self.assertEqual(df['n'].tolist(), [1, 3, 3, 5])
+
+    def test_columns_without_nulls(self):
+        """
+        Test that columns without nulls keep their values and dtype
+        """
+        df = dataCleaner(self.df).fill_na('mean', ['a', 'i']).df
+        self.assertEqual(df['i'].dtype, np.int64)
+        self.assertEqual(df['i'].tolist(), [1, 2, 3, 4, 5])
+
+    def test_input_value(self):
+        """
+        Test that an unknown fill type leaves the data frame untouched
+        """
+        df = dataCleaner(self.df).fill_na('max', ['a']).df
+        self.assertTrue(np.isnan(df['a'][1]))
+
+
+class TestClean(unittest.TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame({'Start': ['4/4/2019 12:01', None],
+                                'x': [1, 2],
+                                'a': [np.nan, 2.0],
+                                'b': [3.0, np.nan]})
+
+    def test_clean(self):
+        """
+        Test that it drops, fills and converts in one go, accepting the
+        pd.Index column lists the notebooks pass
+        """
+        df = dataCleaner(self.df).clean(pd.Index(['x']), pd.Index(['a']),
+                                        ['b'], [], ['Start']).df
+        self.assertEqual(df.columns.tolist(), ['Start', 'a', 'b'])
+        self.assertEqual(df['a'].tolist(), [2.0, 2.0])
+        self.assertEqual(df['b'].tolist(), [3.0, 3.0])
+        self.assertEqual(df['Start'][0], pd.Timestamp('2019-04-04 12:01'))
+        self.assertTrue(self.df['a'].isna().any())
+
+    def test_input_value(self):
+        """
+        Test that a column both dropped and cleaned is rejected
+        """
+        self.assertRaises(ValueError, dataCleaner(self.df).clean, ['a'],
+                          ['a'], [], [], [])
+
+
+class TestPercentMissing(unittest.TestCase):
+    def missing_output(self, df):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            dataCleaner(df).percent_missing(df)
+        return out.getvalue().splitlines()[-1]
+
+    def test_percent_missing(self):
+        """
+        Test that it counts the missing values of every column type
+        """
+        df = pd.DataFrame({'a': [1.0, np.nan, 3.0, np.nan],
+                           's': ['x', None, 'y', 'z'],
+                           'i': [1, 2, 3, 4]})
+        self.assertEqual(self.missing_output(df),
+                         'The dataset contains 25.0 % missing values.')
+
+    def test_nullable_float(self):
+        """
+        Test that nullable Float64 columns are counted too
+        """
+        df = pd.DataFrame({'a': pd.array([1.0, None], dtype='Float64'),
+                           'b': [1.0, np.nan],
+                           'i': pd.array([1, None], dtype='Int64')})
+        self.assertEqual(self.missing_output(df),
+                         'The dataset contains 50.0 % missing values.')
+
+
+class TestChooseKMeans(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        # three well separated blobs
+        self.data = np.concatenate([rng.normal(loc, 0.1, size=(200, 3))
+                                    for loc in (0.0, 5.0, 10.0)])
+
+    def test_ndarray(self):
+        """
+        Test that it sweeps a numpy array, as returned by normalize in the
+        engagement notebook
+        """
+        distortions, inertias = dataCleaner(None).choose_k_means(self.data, 5)
+        self.assertEqual(len(distortions), 4)
+        self.assertEqual(len(inertias), 4)
+        # the elbow sits at the 3 blobs
+        self.assertGreater(distortions[1], distortions[2])
+        self.assertLess(distortions[2], 0.25)
+
+    def test_data_frame(self):
+        """
+        Test that a data frame gives the same sweep as its array
+        """
+        expected = dataCleaner(None).choose_k_means(self.data, 4)
+        result = dataCleaner(None).choose_k_means(pd.DataFrame(self.data), 4)
+        self.assertEqual(result, expected)
+
+    def test_empty_sweep(self):
+        """
+        Test that there is nothing to fit for a num of 1 or less
+        """
+        for num in (0, 1):
+            self.assertEqual(dataCleaner(None).choose_k_means(self.data, num),
+                             ([], []))
+
+
+class TestMinDistances(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.X = rng.normal(size=(5000, 7)).astype(np.float32)
+        self.centers = rng.normal(size=(4, 7)).astype(np.float32)
+        self.X_sq_norms = np.einsum('ij,ij->i', self.X, self.X,
+                                    dtype=np.float64)
+        self.expected = cdist(self.X, self.centers).min(axis=1)
+
+    def check(self):
+        result = cleaner_module._min_distances(self.X, self.centers,
+                                               self.X_sq_norms)
+        np.testing.assert_allclose(result, self.expected, rtol=1e-4,
+                                   atol=1e-4)
+
+    @unittest.skipIf(cleaner_module._nearest_center_kernel is None,
+                     'numba is not installed')
+    def test_numba(self):
+        """
+        Test that the numba kernel matches scipy's cdist
+        """
+        self.check()
+
+    @unittest.skipIf(cleaner_module._simd_cdist is None,
+                     'simsimd is not installed')
+    def test_simsimd(self):
+        """
+        Test that the simsimd path matches scipy's cdist
+        """
+        with mock.patch.object(cleaner_module, '_nearest_center_kernel',
+                               None):
+            self.check()
+
+    def test_blas(self):
+        """
+        Test that the BLAS fallback matches scipy's cdist
+        """
+        with mock.patch.object(cleaner_module, '_nearest_center_kernel',
+                               None), \
+                mock.patch.object(cleaner_module, '_simd_cdist', None):
+            self.check()
+
+    def test_blas_large_values(self):
+        """
+        Test that the BLAS fallback keeps its precision on unnormalized
+        values around 1e8
+        """
+        rng = np.random.default_rng(2)
+        self.X = (1e8 + 8 * rng.integers(0, 3, (1000, 5))).astype(np.float32)
+        self.centers = self.X[:3].copy()
+        self.centers[:, 0] += 8
+        self.X_sq_norms = np.einsum('ij,ij->i', self.X, self.X,
+                                    dtype=np.float64)
+        self.expected = cdist(self.X.astype(np.float64),
+                              self.centers.astype(np.float64)).min(axis=1)
+        self.test_blas()
+
+
+@unittest.skipIf(cleaner_module.pl is None, 'polars is not installed')
+class TestPolarsPath(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.df = pd.DataFrame({
+            'a': rng.normal(size=1000),
+            'b': rng.exponential(size=1000),
+            'i': np.arange(1000),
+            'f': rng.normal(size=1000).astype(np.float32),
+            'n': pd.array(rng.integers(0, 3, 1000) * 2, dtype='Int64')})
+        self.df.loc[::9, 'a'] = np.nan
+        self.df.loc[::13, 'b'] = np.nan
+        self.df.loc[::7, 'f'] = np.nan
+        self.df.loc[::5, 'n'] = pd.NA
+
+    def run_both(self, func, *args):
+        with_polars = self.df.copy()
+        func(with_polars, *args)
+        with_numpy = self.df.copy()
+        with mock.patch.object(cleaner_module, 'pl', None):
+            func(with_numpy, *args)
+        pd.testing.assert_frame_equal(with_polars, with_numpy)
+
+    def test_fill_median(self):
+        """
+        Test that polars and numpy fill the nulls with the same medians
+        """
+        self.run_both(cleaner_module._fill_nan_with, ['a', 'b', 'i'],
+                      'median')
+
+    def test_fill_mean(self):
+        """
+        Test that polars and numpy fill the nulls with the same means
+        """
+        self.run_both(cleaner_module._fill_nan_with, ['a', 'b'], 'mean')
+
+    def test_cap_with_median(self):
+        """
+        Test that polars and numpy cap the same outliers
+        """
+        for column in ['a', 'b', 'i', 'f', 'n']:
+            self.run_both(cleaner_module._cap_with_median, column)
+
+    def test_dtypes(self):
+        """
+        Test that both paths keep float32 and nullable integer columns
+        """
+        self.run_both(cleaner_module._fill_nan_with, ['f', 'n'], 'median')
+        df = self.df.copy()
+        cleaner_module._fill_nan_with(df, ['f', 'n'], 'median')
+        self.assertEqual(df['f'].dtype, np.float32)
+        self.assertEqual(str(df['n'].dtype), 'Int64')
+
+    def test_integer_labels(self):
+        """
+        Test that both paths handle integer column labels
+        """
+        self.df.columns = range(len(self.df.columns))
+        self.run_both(cleaner_module._fill_nan_with, [0, 1], 'median')
+        self.run_both(cleaner_module._cap_with_median, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()